@@ -1,17 +1,22 @@
 from __future__      import annotations
 from copy            import copy
+from math            import hypot
 from rich            import print
 
 from gcode_geom       import GPoint, GSegment, GHalfLine
 from gcode_geom.angle import Angle
-from gcode_geom.utils import ang_diff
+from gcode_geom.utils import ang_diff, eps
 from bed            import Bed
 from ring           import Ring
 from python_gcode.gcode_printer  import GCodePrinter
 from python_gcode.gcline         import GCLine, comments, comment
 from logger         import rprint
 from util           import Saver, Number
-from config         import get_general_config, get_ring_config, get_bed_config
+from config         import get_general_config, get_ring_config, get_bed_config, HeadCrossesThread
+
+#Set to a gcode line number to print head_cross_thread()/sync_ring() details
+# for that line
+_DEBUG_HEAD_CROSS_LINENO: int|None = None
 
 
 class Ender3(GCodePrinter):
@@ -19,6 +24,11 @@ class Ender3(GCodePrinter):
 		self.config = config
 		self.general_config = get_general_config(config)
 		print(f"Loaded general config: {self.general_config}")
+		#Head-crosses-thread settings per move type, with unset values as 0, so
+		# gcfunc_move_axis() doesn't have to look them up for every line
+		self._cross_config: dict[str, HeadCrossesThread] = {
+			move_type: {k: v or 0 for k,v in self.general_config[move_type].items()}
+			for move_type in ('anchor_fixing', 'extruding', 'non_extruding')}
 		self.ring_config = get_ring_config(config)
 		print(f"Loaded ring: {self.ring_config}")
 		self.bed_config  = get_bed_config(config)
@@ -52,12 +62,32 @@ class Ender3(GCodePrinter):
 		#Comment out any G90s we find
 		self.add_codes('G90', action=self.gfunc_set_absolute_positioning)
 
+		#Template line cached by _restore_feedrate_line()
+		self._restore_f = None
+		self._restore_f_line: GCLine|None = None
+
 
 
 	def __repr__(self):
 		return f'Ender3(🧵={self.thread_path}, x={self.x}, y={self.y}, z={self.z})'
 
 
+	@property
+	def thread_path(self) -> GHalfLine|None: return self._thread_path
+
+	@thread_path.setter
+	def thread_path(self, thread_path:GHalfLine|None):
+		self._thread_path = thread_path
+		#head_cross_thread() needs the 2D thread for every xy move, so make it once,
+		# along with its anchor and unit direction as floats for _head_misses_thread()
+		self._thread_path_2d = None if thread_path is None else thread_path.as2d()
+		self._thread_path_xy = None
+		if thread_path is not None:
+			p, v = thread_path.point, thread_path.vector
+			if dlen := hypot(v[0], v[1]):
+				self._thread_path_xy = (p.x, p.y, v[0]/dlen, v[1]/dlen)
+
+
 	@property
 	def info(self): return f'🧵{self.thread_path},  ⃘{self.ring.angle:.3f}°'
 
@@ -200,6 +230,7 @@ class Ender3(GCodePrinter):
 		# gfunc_set_axis_value() function. This might return multiple lines, so we
 		# need to process each of the returned list values.
 		super_gclines = super().gcfunc_move_axis(gcline, **kwargs) or [gcline]
+		anchoring = kwargs.get('anchoring', False)
 
 		for gcline in super_gclines:
 			if not gcline.is_xymove:
@@ -217,32 +248,35 @@ class Ender3(GCodePrinter):
 
 			isec = self.head_cross_thread(prev_loc, gcline) if gcline.is_xymove else None
 
-			move_type = None
-			if isec:
-				if kwargs.get('anchoring',False):
-					move_type = 'anchor_fixing'
-				elif 'E' in gcline.args:
-					move_type = 'extruding'
-				else:
-					move_type = 'non_extruding'
+			if not isec:
+				move_type, cross_config = None, None
+			else:
+				move_type = 'anchor_fixing' if anchoring else 'extruding' if 'E' in gcline.args else 'non_extruding'
+				cross_config = self._cross_config[move_type]
 
 			saveZ = self.head_loc.z
-			raise_amt = self.general_config[move_type]['head_raise'] or 0 if isec else 0
-			raise_speed = self.general_config[move_type]['head_raise_speed'] or 0 if isec else 0
+			raise_amt = cross_config['head_raise'] if isec else 0
+			raise_speed = cross_config['head_raise_speed'] if isec else 0
 			if raise_amt > 0:
 				gclines.append(GCLine('G0',
 				args={'Z':self.head_loc.z + raise_amt, 'F': raise_speed},
 					comment=f'gfunc_move_axis({gcline}) raise head by {raise_amt} to avoid thread snag'))
-				gclines.append(GCLine('G0', args={'F': self.f}, comment='Returning original feed rate'))
+				gclines.append(self._restore_feedrate_line())
 
 			#If the bed is moving, we want to move the thread simultaneously to keep
 			# it in the same relative position
 			if gcline.y is not None and gcline.y != prev_loc.y:
 				gcline = self.sync_ring(gcline)
 
+			#Not crossing the thread, so there's nothing to adjust or annotate: keep
+			# the line itself rather than an unchanged copy with an empty comment
+			if move_type is None and not gcline.comment:
+				gclines.append(gcline)
+				continue
+
 			#Add the line to the list of lines to be executed, with multiplied extrusion amount and adjusted feedrate if necessary
-			extrustion_multiplier = self.general_config[move_type]['extrude_multiply'] or 0 if move_type else 0
-			adjusted_feedrate = self.general_config[move_type]['move_feedrate'] or 0 if move_type else 0
+			extrustion_multiplier = cross_config['extrude_multiply'] if move_type else 0
+			adjusted_feedrate = cross_config['move_feedrate'] if move_type else 0
 			newArgs = {}
 			if 'E' in gcline.args and extrustion_multiplier > 0:
 				newArgs['E'] = gcline.args['E'] * extrustion_multiplier
@@ -257,11 +291,11 @@ class Ender3(GCodePrinter):
 			gclines.append(gcline.copy(args=newArgs, comment=', '.join(debug_cmt)))
 
 			if adjusted_feedrate:
-				gclines.append(GCLine('G0', args={'F': self.f}, comment='Returning original feed rate'))
+				gclines.append(self._restore_feedrate_line())
 
 			#Pause for moves if so configured
 			if isec:
-				if (pause := self.general_config[move_type]['post_pause'] or 0) > 0:
+				if (pause := cross_config['post_pause']) > 0:
 					gclines.append(GCLine(code='G4', args={'S': pause}, comment=f'Pause for {pause} sec after move'))
 
 			#If we changed the z-height during a head-thread crossing move above, we
@@ -269,16 +303,26 @@ class Ender3(GCodePrinter):
 			if raise_amt > 0:
 				gclines.append(
 					GCLine('G0', args={'Z': saveZ, 'F': raise_speed}, comment='Drop head back to original location'))
-				gclines.append(GCLine('G0', args={'F': self.f}, comment='Returning original feed rate'))
+				gclines.append(self._restore_feedrate_line())
 
 		return gclines
 
 
+	def _restore_feedrate_line(self) -> GCLine:
+		"""Return a line setting the feed rate back to the current `self.f`. The
+		template line is only rebuilt when `self.f` changes; each call returns a
+		copy of it, so no GCLine appears more than once in the output."""
+		if self._restore_f_line is None or self._restore_f != self.f:
+			self._restore_f = self.f
+			self._restore_f_line = GCLine('G0', args={'F': self.f}, comment='Returning original feed rate')
+		return self._restore_f_line.copy()
+
+
 	def sync_ring(self, gcline:GCLine) -> GCLine:
 		"""Return the a copy of the line with a ring movement added to keep the
 		thread angle in sync with bed movement. Update the ring angle accordingly.
 		If the line contains no y movement, return the line unmodified."""
-		if 'fake from [747]' in (gcline.comment or '') and gcline.x == 69.8:
+		if _DEBUG_HEAD_CROSS_LINENO is not None and gcline.lineno == _DEBUG_HEAD_CROSS_LINENO:
 			print(f'ring_delta_for_thread({self.thread_path}, {gcline.y}) with ring {self.ring}')
 		ring_move_by = self.ring_delta_for_thread(self.thread_path, gcline.y)
 
@@ -338,8 +382,15 @@ class Ender3(GCodePrinter):
 		in `gcline` would cause the head to cross the thread, or None if it doesn't."""
 		if head_loc.x == gcline.x and head_loc.y == gcline.y:
 			return None
+		debug = _DEBUG_HEAD_CROSS_LINENO is not None and gcline.lineno == _DEBUG_HEAD_CROSS_LINENO
+
+		#Most moves are nowhere near the thread; rule those out with float math
+		# before building any geometry
+		if not debug and self._head_misses_thread(head_loc, gcline):
+			return None
+
 		head_traj = GSegment(head_loc.as2d(), head_loc.copy(x=gcline.x, y=gcline.y, z=0))
-		if gcline.lineno == 1285:
+		if debug:
 			print(f'Line: {gcline}, head: {head_loc}')
 			print(f'Head set by: {self.head_set_by}')
 			print(f'Prev head: {self.prev_loc}')
@@ -347,7 +398,24 @@ class Ender3(GCodePrinter):
 			print(f'Traj: {head_traj}')
 			print(f'Thread: {self.thread_path}')
 		#Assuming here that the ring is synced to the bed movement
-		return self.thread_path.as2d().intersection(head_traj)
+		return self._thread_path_2d.intersection(head_traj)
+
+
+	def _head_misses_thread(self, head_loc, gcline:GCLine) -> bool:
+		"""Return True if the move from `head_loc` to `gcline` clearly can't cross
+		the thread in 2D: both ends are more than `eps` to the same side of the
+		thread's line, or both are more than `eps` behind its anchor. False means
+		the exact test in head_cross_thread() is needed."""
+		if gcline.x is None or gcline.y is None or self._thread_path_xy is None:
+			return False
+		px, py, dx, dy = self._thread_path_xy
+
+		sx, sy = head_loc.x - px, head_loc.y - py
+		ex, ey = gcline.x   - px, gcline.y   - py
+		s_side, e_side = dx*sy - dy*sx, dx*ey - dy*ex
+		if (s_side > eps and e_side > eps) or (s_side < -eps and e_side < -eps):
+			return True
+		return dx*sx + dy*sy < -eps and dx*ex + dy*ey < -eps
 
 
 
@@ -1,17 +1,22 @@
 from __future__ import annotations
+from math import hypot
+from bisect import bisect_left
+from functools import lru_cache
 from Geometry3D import Vector, Plane, Line, get_eps
 from python_gcode.gcline import GCLines
 from dataclasses import make_dataclass
 from typing import Collection
-from more_itertools import flatten
 
 from util import Number
 from gcode_geom import GPoint, GSegment, GHalfLine, GPolyLine
 from gcode_geom.utils import tangent_points, eps
 from gcode_geom.gcast import gcastr
 
-Geometry = make_dataclass('Geometry', ['segments', 'planes', 'outline'])
-Planes   = make_dataclass('Planes',   ['top', 'bottom'])
+Geometry = make_dataclass('Geometry', ['segments', 'planes', 'outline'], slots=True)
+Planes   = make_dataclass('Planes',   ['top', 'bottom'],             slots=True)
+
+#Shared by traj_isec() rather than built on every call
+X_AXIS = Line.x_axis()
 
 
 def thread_z_snap(thread:GPolyLine, layer_z_heights:list[Number]) -> GPolyLine:
@@ -21,16 +26,23 @@ def thread_z_snap(thread:GPolyLine, layer_z_heights:list[Number]) -> GPolyLine:
 	thread = GPolyLine(thread.points)
 	zs = layer_z_heights
 
+	#Sorted heights for finding the closest one by bisection, and the position
+	# of each height in zs (first occurrence, like zs.index())
+	zsorted = sorted(zs)
+	zidx: dict[Number, int] = {}
+	for i,z in enumerate(zs):
+		zidx.setdefault(z, i)
+
 	#First, snap each point in the thread to the closest layer z; skip the
 	# first point as it should be the bed anchor
 	for p in thread.points[1:]:
-		thread.move(p, z=min(zs, key=lambda m:abs(m-p.z))-p.z)
+		thread.move(p, z=_closest(zsorted, p.z)-p.z)
 
 	#Now, for any thread segment which doesn't start and end on the same layer,
 	# split it; skip the first segment since it's the bed anchor as start point
 	for seg in thread.segments[1:]:
-		mps = zs.index(seg.start_point.z)
-		mpe = zs.index(seg.end_point.z)
+		mps = zidx[seg.start_point.z]
+		mpe = zidx[seg.end_point.z]
 		if mps > mpe: mps, mpe = mpe, mps
 
 		#For each layer height from the start point to the end point...
@@ -44,6 +56,16 @@ def thread_z_snap(thread:GPolyLine, layer_z_heights:list[Number]) -> GPolyLine:
 	return thread
 
 
+def _closest(zsorted:list[Number], z:Number) -> Number:
+	"""Return the value in the sorted list `zsorted` closest to `z`, preferring
+	the lower one on a tie."""
+	i = bisect_left(zsorted, z)
+	if i == 0:            return zsorted[0]
+	if i == len(zsorted): return zsorted[-1]
+	lo, hi = zsorted[i-1], zsorted[i]
+	return lo if z - lo <= hi - z else hi
+
+
 def thread_snap(thread:GPolyLine, layers) -> GPolyLine:
 	"""Return a copy of `thread` snapped to the z-heights and geometry in
 	`layers`."""
@@ -63,67 +85,172 @@ def visibility(origin:GPoint, query:Collection[GSegment], avoid_by=1) -> dict[GP
 		{visible_point: {segments intersected}, ...}
 
 	"""
-	#All of the endpoints of the segments in query, except for origin
-	endpoints = set(flatten(query)) - {origin}
-
-	#All of the endpoints that are at least avoid_by mm away from origin
-	farpoints = {p for p in endpoints if origin.distance(p) > avoid_by}
+	#Number the segment endpoints and pull out their coordinates, relative to
+	# origin, in one pass. The loop below works per endpoint rather than per
+	# segment, so segments sharing an endpoint share its float math, and most
+	# segments are rejected before the Geometry3D tests.
+	ox, oy, oz = origin.x, origin.y, origin.z
+	ep_idx: dict[GPoint, int] = {}
+	seg_idx = []
+	for seg in query:
+		sp, ep = seg.start_point, seg.end_point
+		seg_idx.append((seg,
+			ep_idx.setdefault(sp, len(ep_idx)), ep_idx.setdefault(ep, len(ep_idx)),
+			sp != origin))
+	ep_pts = list(ep_idx)
+	ep_rel = [(p.x - ox, p.y - oy, p.z - oz) for p in ep_pts]
+
+	#All of the endpoints, except for origin, that are at least avoid_by mm away
+	# from origin
+	far2 = avoid_by * avoid_by
+	farpoints = [p for p, (wx, wy, wz) in zip(ep_pts, ep_rel)
+							if wx*wx + wy*wy + wz*wz > far2 and p != origin]
 
 	#If farpoints is empty, then all of the endpoints are too close to origin
 	if not farpoints: return {origin: set(query)}
 
-	#For each point not within avoid_by mm of origin, find the tangent points of
-	# a line from origin to a circle of size avoid_by around that point
-	tanpoints = set(flatten(tangent_points(p, avoid_by, origin) for p in farpoints))
+	#For each point not within avoid_by mm of origin, the tangent points of a
+	# line from origin to a circle of size avoid_by around that point. These are
+	# generated as the loop below consumes them rather than collected first.
+	o = tuple(origin[:])
+	tanpoints = (GPoint(*tp) for p in farpoints for tp in _tangent_points(tuple(p[:]), avoid_by, o))
+
+	#Anything further than this from a half-line in 2D can't intersect it or be
+	# too_close() to it
+	reach = avoid_by + eps
 
 	intersecting_segments: dict[GPoint, set] = {}
 
 	#For each tangent point, find the segments in query that intersect a half-line
 	# from origin to that tangent point
 	for tp in tanpoints:
-		hl = GHalfLine(origin, tp)
+		if tp in intersecting_segments: continue
 		intersecting_segments[tp] = set()
+		hl = None
+
+		#Unit direction of the half-line in 2D
+		hx, hy = tp.x - ox, tp.y - oy
+		dlen = hypot(hx, hy)
+		if dlen:
+			#Signed distance across the half-line of each endpoint, in 2D
+			dx, dy = hx/dlen, hy/dlen
+			side = [dx*wy - dy*wx for wx, wy, _ in ep_rel]
 
-		for seg in query:
-			#Does a half-line from the origin to the tangent point intersect this segment?
+		#too_close() result for each endpoint, filled in as needed
+		near: list[bool|None] = [None] * len(ep_idx)
+
+		for seg, si, ei, check_start in seg_idx:
+			if dlen and _out_of_reach(side[si], side[ei], reach):
+				continue
+
+			#Does a half-line from the origin to the tangent point intersect this
+			# segment? Only build the half-line once a segment needs it.
+			if hl is None: hl = GHalfLine(origin, tp)
 			if hl.intersecting(seg):
 				intersecting_segments[tp].add(seg)
-			else:
-				if seg.start_point != origin and too_close(hl, seg.start_point, avoid_by):
-					intersecting_segments[tp].add(seg)
-				elif too_close(hl, seg.end_point, avoid_by):
+				continue
+
+			#Otherwise, is either endpoint too close to the half-line? An endpoint
+			# more than `reach` across the line in 2D can't be, so skip distance()
+			# for those and let too_close() decide the rest.
+			for i in ((si, ei) if check_start else (ei,)):
+				if near[i] is None:
+					near[i] = not (dlen and abs(side[i]) > reach) and too_close(hl, ep_pts[i], avoid_by)
+				if near[i]:
 					intersecting_segments[tp].add(seg)
+					break
 
 	#Sort the intersected segments by the number of segments they intersect
 	return dict(sorted(intersecting_segments.items(), key=lambda x:len(x[1])))
 
 
+@lru_cache(maxsize=65536)
+def _tangent_points(p:tuple, by:Number, origin:tuple) -> tuple:
+	"""Cached version of tangent_points() on (x, y, z) tuples. Successive calls
+	to visibility() from the same thread anchor mostly see the same endpoints, so
+	most calls are hits; check with _tangent_points.cache_info()."""
+	return tuple(tuple(tp[:]) for tp in tangent_points(GPoint(*p), by, GPoint(*origin)))
+
+
+def _out_of_reach(s_side, e_side, reach) -> bool:
+	"""Return True if a segment can neither intersect a half-line nor have an
+	endpoint within `reach` of it, given each endpoint's signed 2D distance
+	across the half-line: both endpoints are further than `reach` to the same
+	side of the line. Since distances in 3D can only be larger, a True result
+	holds in 3D as well."""
+	return (s_side > reach and e_side > reach) or (s_side < -reach and e_side < -reach)
+
+
 def too_close(a, b, by=1) -> bool:
 	"""Return True if the distance between `a` and `b` is <= `by` (taking into
 	account imprecision via `eps`)."""
+	#Point-to-point is the common case; compare squared distances to skip the
+	# sqrt and the generic distance() dispatch
+	if isinstance(a, GPoint) and isinstance(b, GPoint):
+		lim = by - eps
+		return lim >= 0 and _dist2(a, b) <= lim*lim
+
 	d = a.distance(b)
 	return False if d is None else d - by <= -eps
 
 
-#Combine subsequent segments on the same line
+def _dist2(a:GPoint, b:GPoint) -> float:
+	"""Return the squared distance between points `a` and `b`."""
+	dx, dy, dz = a.x - b.x, a.y - b.y, a.z - b.z
+	return dx*dx + dy*dy + dz*dz
+
+
+def _seg_dir(seg:GSegment) -> tuple[tuple, tuple]:
+	"""Return the start point and direction of `seg` as float tuples."""
+	sp, ep = seg.start_point, seg.end_point
+	return (sp.x, sp.y, sp.z), (ep.x - sp.x, ep.y - sp.y, ep.z - sp.z)
+
+
+def _maybe_collinear(a:tuple[tuple, tuple], b:tuple[tuple, tuple]) -> bool:
+	"""Return False if segments `a` and `b`, given as (start, direction) tuples
+	from _seg_dir(), are clearly not on the same line. This is only a
+	conservative prefilter in front of Geometry3D's tolerance-based Line
+	comparison: its tolerance is loose (1e-6, both absolute and relative to
+	length), so a True result still has to be confirmed with Line.__eq__."""
+	(sax, say, saz), (ax, ay, az) = a
+	(sbx, sby, sbz), bdir         = b
+	aa = ax*ax + ay*ay + az*az
+
+	#Check b's direction, then the offset of b's start from a's line
+	for ux, uy, uz in (bdir, (sbx - sax, sby - say, sbz - saz)):
+		cx, cy, cz = ay*uz - az*uy, az*ux - ax*uz, ax*uy - ay*ux
+		cc = cx*cx + cy*cy + cz*cz
+		if cc > 1e-12 and cc > 1e-12 * aa * (ux*ux + uy*uy + uz*uz):
+			return False
+	return True
+
+
 def seg_combine(segs):
+	"""Combine subsequent segments on the same line."""
 	if not segs: return []
 	r = [segs[0]]
-	for seg in segs[1:]:
-		if seg.line == r[-1].line:
-			# print(f'Combine {r[-1]}, {seg}', end='')
+
+	#Start point and direction of each segment, read once, and of r[-1]
+	dirs = [_seg_dir(seg) for seg in segs]
+	rdir = dirs[0]
+
+	for seg, sdir in zip(segs[1:], dirs[1:]):
+		if _maybe_collinear(sdir, rdir) and seg.line == r[-1].line:
 			if seg.end_point == r[-1].start_point:
 				r[-1] = GSegment(seg.start_point, r[-1].end_point)
 			elif r[-1].end_point == seg.start_point:
 				r[-1] = GSegment(r[-1].start_point, seg.end_point)
 			else:
-				s1 = GSegment(  seg.start_point, r[-1].end_point)
-				s2 = GSegment(r[-1].start_point,   seg.end_point)
-				r[-1] = max(s1, s2, key=lambda s: s.length())
-			# print(f' -> {r[-1]}')
+				#Keep the longer of the two spans; compare squared lengths so only the
+				# winning GSegment gets built
+				if _dist2(seg.start_point, r[-1].end_point) >= _dist2(r[-1].start_point, seg.end_point):
+					r[-1] = GSegment(seg.start_point, r[-1].end_point)
+				else:
+					r[-1] = GSegment(r[-1].start_point, seg.end_point)
+			rdir = _seg_dir(r[-1])
 		else:
-			# print(f"Don't combine {r[-1]}, {seg}")
 			r.append(seg)
+			rdir = sdir
 	return r
 
 
@@ -136,49 +263,53 @@ def gcode2segments(lines:GCLines, z, keep_moves_with_extrusions=True):
 	movements into independent GSegments; otherwise, sequences of non-extrusion
 	moves preceding an extrusion move will be grouped into the extrusion move.
 	"""
-	lines    = lines.copy()
-	last     = None
+	lines    = list(lines)
 	extra    = GCLines()
 	preamble = GCLines()
 	segments = []
 
-	#Put all beginning non-extrusion lines into preamble
-	while lines and not lines.first.is_xyextrude:
-		preamble.append(lines.popidx(0))
+	#Classify each line once up front; the scans and the loops below consult
+	# these flags instead of re-asking each line.
+	is_ext  = [line.is_xyextrude for line in lines]
+	is_move = [line.is_xymove    for line in lines]
 
-	#Put back lines from the end until we get an xymove
-	putback = []
-	while preamble and not preamble.last.is_xymove:
-		putback.append(preamble.popidx(-1))
-	if preamble.last.is_xymove: putback.append(preamble.popidx(-1))
-	if putback: lines = list(reversed(putback)) + lines
+	#All beginning non-extrusion lines go into the preamble, except for the last
+	# xymove before the first extrusion (and anything after it), which starts the
+	# first segment. Find both split points by index rather than popping from the
+	# front of the list, which is quadratic.
+	first_ext = next((i for i,e in enumerate(is_ext) if e), len(lines))
+	start     = next((i for i in range(first_ext-1, -1, -1) if is_move[i]), 0)
+	for line in lines[:start]:
+		preamble.append(line)
 
 	#Put the first xymove as the "last" item
-	last = lines.popidx(0)
+	last     = lines[start]
+	last_ext = is_ext[start]
+	flags    = zip(lines[start+1:], is_ext[start+1:], is_move[start+1:])
 
 	if keep_moves_with_extrusions:
-		for line in lines:
-			if line.is_xyextrude:
-				line.segment = GSegment(last, line, z=z, gc_lines=extra, is_extrude=line.is_xyextrude)
+		for line, ext, move in flags:
+			if ext:
+				line.segment = GSegment(last, line, z=z, gc_lines=extra, is_extrude=ext)
 				segments.append(line.segment)
-				last = line
+				last, last_ext = line, ext
 				extra = GCLines()
-			elif line.is_xymove:
-				if not last.is_xyextrude:
+			elif move:
+				if not last_ext:
 					extra.append(last)
-				last = line
+				last, last_ext = line, ext
 			else:
 				extra.append(line)
-		if not last.is_xyextrude and last not in extra:
+		if not last_ext and last not in extra:
 			extra.append(last)
 			extra.sort()
 
 	else:
 		#Now take pairs of xymove lines, accumulating intervening non-move lines in
 		# extra
-		for line in lines:
-			if line.is_xymove:
-				line.segment = GSegment(last, line, z=z, gc_lines=extra, is_extrude=line.is_xyextrude)
+		for line, ext, move in flags:
+			if move:
+				line.segment = GSegment(last, line, z=z, gc_lines=extra, is_extrude=ext)
 				segments.append(line.segment)
 				last  = line
 				extra = GCLines()
@@ -231,14 +362,14 @@ the same. In this case the function will return a GSegment rather than a
 GPoint.
 """
 def traj_isec(seg:GSegment, thread:GSegment) -> None|GPoint|GSegment:
-	tx1 = Line.x_axis().intersection(
+	tx1 = X_AXIS.intersection(
 		GSegment(
 			thread.start_point.moved(y=-seg.start_point.y),
 			thread.end_point,
 			z=0))
 	if not tx1: return None
 
-	tx2 = Line.x_axis().intersection(
+	tx2 = X_AXIS.intersection(
 		GSegment(
 			thread.start_point.moved(y=-seg.end_point.y),
 			thread.end_point,
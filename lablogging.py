@@ -14,6 +14,15 @@ class OutputWidgetHandler(logging.Handler):
 
 	def emit(self, record):
 		formatted_record = self.format(record)
+
+		#Append to the last stdout stream if there is one, rather than rebuilding
+		# the whole outputs tuple for every record
+		outs = self.output_widget.outputs
+		if outs and outs[-1].get('output_type') == 'stream' and outs[-1].get('name') == 'stdout':
+			outs[-1]['text'] += formatted_record + '\n'
+			self.output_widget.send_state('outputs')
+			return
+
 		new_output = {
 			'name':        'stdout',
 			'output_type': 'stream',
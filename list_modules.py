@@ -19,8 +19,11 @@ def list_modules(*files):
 	node_iter.visit_ImportFrom = visit_ImportFrom
 
 	for fn in files:
-		with open(fn) as f:
-			node_iter.visit(ast.parse(f.read()))
+		with open(fn, 'rb') as f:
+			data = f.read()
+		#No need to build the AST for a file that can't contain an import
+		if b'import' in data:
+			node_iter.visit(ast.parse(data))
 
 	return modules
 
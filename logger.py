@@ -8,20 +8,22 @@ rich_log = logging.getLogger('threader')
 rich_log.setLevel(logging.DEBUG)
 
 def rprint(*args, indent_char=' ', indent=0, **kwargs):
-	msg = ''
+	parts = []
+	last  = len(args) - 1
 	for i,arg in enumerate(args):
 		if isinstance(arg, (list,tuple,set)):
 			if len(arg) == 0:
-				if i > 0: msg += ' '
-				msg += str(arg)
+				if i > 0: parts.append(' ')
+				parts.append(str(arg))
 			else:
 				nl = '\n' + indent_char * indent
-				if i > 0: msg += nl
-				msg += nl.join(map(str,arg))
-				if i < len(args)-1: msg += '\n'
+				if i > 0: parts.append(nl)
+				parts.append(nl.join(map(str,arg)))
+				if i < last: parts.append('\n')
 		else:
-			if i > 0: msg += ' '
-			msg += str(arg)
+			if i > 0: parts.append(' ')
+			parts.append(str(arg))
+	msg = ''.join(parts)
 
 	style = kwargs.get('style', {})
 	div   = kwargs.get('div', False)
@@ -1,5 +1,7 @@
 from __future__      import annotations
 from copy            import copy
+from dataclasses     import make_dataclass
+from functools       import cached_property
 from rich            import print
 
 from gcode_geom       import GPoint, GSegment, GHalfLine
@@ -9,6 +11,13 @@ from python_gcode.gcline         import GCLine, comment
 from logger         import rprint
 from config         import get_general_config, get_bed_config
 
+#Configuration read once by Manualprinter; the GCLines in these are templates to
+# be copied into the output
+_ParkConfig = make_dataclass('_ParkConfig', ['use_blob_anchors', 'pre_park_location',
+	'retract_amount', 'retract_feedrate', 'chirp_line', 'pause_line'], frozen=True, slots=True)
+_BlobConfig = make_dataclass('_BlobConfig', ['use_blob_anchors', 'unpark_feedrate',
+	'blob_amount2', 'blob_raise', 'blob_raise_feedrate', 'unretract_line'], frozen=True, slots=True)
+
 
 class Manualprinter(GCodePrinter):
 	def __init__(self, config, initial_thread_path:GHalfLine, *args, **kwargs):
@@ -73,20 +82,10 @@ class Manualprinter(GCodePrinter):
 
 		gclines: list[GCLine] = []
 
-		manual_settings = self.config['general']['manual_printer']
-		park_settings = manual_settings['park_settings']
-		blob_settings = manual_settings['blob_anchors']
-		if not blob_settings['use_blob_anchors']:
+		blob_config = self._blob_config
+		if not blob_config.use_blob_anchors:
 			return gclines
 
-		retract_amount      = park_settings['retract_amount']
-		unpark_feedrate     = park_settings['unpark_feedrate']
-		blob_amount1        = blob_settings['blob_amount1']
-		blob_amount2        = blob_settings['blob_amount2']
-		blob_feedrate       = blob_settings['blob_feedrate']
-		blob_raise          = blob_settings['blob_raise']
-		blob_raise_feedrate = blob_settings['blob_raise_feedrate']
-
 		#Ensure relative extruder mode
 		was_abs = False
 		if self.e_mode != E_REL:
@@ -100,15 +99,14 @@ class Manualprinter(GCodePrinter):
 		blob_point = GSegment(self.target_anchor, self.curr_gcseg.start_point).point_at_dist(.4)
 		blob_line = GCLine('G0',
 										args={'X':blob_point.x, 'Y':blob_point.y, 'Z':blob_point.z,
-													'F':unpark_feedrate},
+													'F':blob_config.unpark_feedrate},
 										comment='Move to blob point')
 		gclines.extend([
 			blob_line,
 			blob_line,   #A second time because the first seems to get eaten by Buddy firmware
-			GCLine( 'G1', args={'E':blob_amount1 - retract_amount, 'F':blob_feedrate},
-						comment='Unretract plus first blob extrude'),
-			GCLine( 'G1', args={'Z':blob_point.z + blob_raise, 'E':blob_amount2,
-							'F':blob_raise_feedrate}, comment='Second blob extrude, with raise'),
+			blob_config.unretract_line.copy(),
+			GCLine( 'G1', args={'Z':blob_point.z + blob_config.blob_raise, 'E':blob_config.blob_amount2,
+							'F':blob_config.blob_raise_feedrate}, comment='Second blob extrude, with raise'),
 			comment('Next thing should be drawing the original anchoring line')
 		])
 
@@ -121,6 +119,25 @@ class Manualprinter(GCodePrinter):
 		return gclines
 
 
+	@cached_property
+	def _blob_config(self) -> _BlobConfig:
+		"""The settings used by blob_anchor(), read from the configuration once."""
+		manual_settings = self.config['general']['manual_printer']
+		park_settings = manual_settings['park_settings']
+		blob_settings = manual_settings['blob_anchors']
+		return _BlobConfig(
+			use_blob_anchors    = blob_settings['use_blob_anchors'],
+			unpark_feedrate     = park_settings['unpark_feedrate'],
+			blob_amount2        = blob_settings['blob_amount2'],
+			blob_raise          = blob_settings['blob_raise'],
+			blob_raise_feedrate = blob_settings['blob_raise_feedrate'],
+			unretract_line      = GCLine('G1',
+				args={'E':blob_settings['blob_amount1'] - park_settings['retract_amount'],
+							'F':blob_settings['blob_feedrate']},
+				comment='Unretract plus first blob extrude'),
+		)
+
+
 	def gfunc_printer_ready(self, gcline: GCLine, **kwargs) -> list[GCLine]:
 		"""At least with the current version of Cura, M109 is the last command
 		before the printer starts actually doing things."""
@@ -135,6 +152,21 @@ class Manualprinter(GCodePrinter):
 		]
 
 
+	@cached_property
+	def _park_config(self) -> _ParkConfig:
+		"""The settings used by gcfunc_move_axis(), read from the configuration once."""
+		manual_settings = self.config['general']['manual_printer']
+		park_settings = manual_settings['park_settings']
+		return _ParkConfig(
+			use_blob_anchors  = self.config['general']['blob_anchors']['use_blob_anchors'],
+			pre_park_location = GPoint(*park_settings['pre_park_location']),
+			retract_amount    = park_settings['retract_amount'],
+			retract_feedrate  = park_settings['retract_feedrate'],
+			chirp_line        = GCLine('M300', args={'S':40, 'P':10} , comment="Notification chirp"),
+			pause_line        = GCLine(manual_settings['pause_command'], comment="Pausing for manual thread angle"),
+		)
+
+
 	def gcfunc_move_axis(self, gcline: GCLine, **kwargs) -> list[GCLine]:
 		"""Process gcode lines with instruction G0, G1."""
 		gclines = []
@@ -143,32 +175,27 @@ class Manualprinter(GCodePrinter):
 		self.prev_loc    = self.head_loc.copy()
 		self.prev_set_by = self.head_set_by
 
-		manual_settings = self.config['general']['manual_printer']
-		park_settings = manual_settings['park_settings']
-
-		pre_park_location = GPoint(*park_settings['pre_park_location'])
-		retract_amount    = park_settings['retract_amount']
-		retract_feedrate  = park_settings['retract_feedrate']
-		#unpark_feedrate   = park_settings['unpark_feedrate']
+		park_config = self._park_config
+		pre_park_location = park_config.pre_park_location
 
 		#Beep, instruct, retract and park
 		gclines.extend([
-			GCLine('M300', args={'S':40, 'P':10} , comment="Notification chirp"),
+			park_config.chirp_line.copy(),
 			GCLine(f'M117 Move to angle {self.thread_path.angle}'),
 			GCLine('G1', args={
 					'X': pre_park_location.x, 'Y': pre_park_location.y,
 					'Z': self.z + pre_park_location.z,
-					'E':retract_amount, 'F':retract_feedrate,
+					'E':park_config.retract_amount, 'F':park_config.retract_feedrate,
 					}, comment="Move to pre-park location",
 				),
-			GCLine(manual_settings['pause_command'], comment="Pausing for manual thread angle"),
+			park_config.pause_line.copy(),
 		])
 
-		if self.config['general']['blob_anchors']['use_blob_anchors']:
+		if park_config.use_blob_anchors:
 			gclines.extend(
 				self.blob_anchor() if self.target_anchor is not None else [])
 		else:
-			gclines.append(GCLine('G1', args={'E': -retract_amount}, comment='Unretract'))
+			gclines.append(GCLine('G1', args={'E': -park_config.retract_amount}, comment='Unretract'))
 
 		gclines.extend(super().gcfunc_move_axis(gcline, **kwargs) or [gcline])
 
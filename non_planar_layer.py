@@ -12,24 +12,23 @@ class NonPlanarLayer(Layer):
 
 
 	def add_geometry(self):
-		lines = self.lines.copy()
+		lines = list(self.lines)
 		extra = GCLines()
 		last = None
 		segments = []
 
-		preamble = GCLines()
-		while lines and not lines.first.is_xyextrude():
-			preamble.append(lines.popidx(0))
-
-		#Put back lines from the end until we get an xymove
-		putback = []
-		while preamble and not preamble.last.is_xymove():
-			putback.append(preamble.popidx(-1))
-		if preamble and preamble.last.is_xymove(): putback.append(preamble.popidx(-1))
-		if putback: lines = list(reversed(putback)) + lines
+		#All beginning non-extrusion lines go into the preamble, except for the last
+		# xymove before the first extrusion (and anything after it). Find both
+		# split points in one scan each instead of popping lines off the front.
+		preamble  = GCLines()
+		first_ext = next((i for i,line in enumerate(lines) if line.is_xyextrude()), len(lines))
+		start     = next((i for i in range(first_ext-1, -1, -1) if lines[i].is_xymove()), 0)
+		for line in lines[:start]:
+			preamble.append(line)
 
 		#Put the first xymove as the "last" item
-		last = lines.popidx(0)
+		last  = lines[start]
+		lines = lines[start+1:]
 
 		for line in lines:
 			if line.is_xyextrude():
@@ -134,13 +134,18 @@ def quickplot(plot3d=False, show=True, **kwargs):
 
 
 def segs_xyz(*segs, **kwargs):
-	#Plot gcode segments. The 'None' makes a break in a line so we can use
-	# just one add_trace() call.
-	x, y, z = [], [], []
-	for s in segs:
-		x.extend([s.start_point.x, s.end_point.x, None])
-		y.extend([s.start_point.y, s.end_point.y, None])
-		z.extend([s.start_point.z, s.end_point.z, None])
+	#Plot gcode segments. Each segment takes three slots in the lists: start,
+	# end, and a 'None' that makes a break in the line so we can use just one
+	# add_trace() call.
+	pts = [(s.start_point, s.end_point) for s in segs]
+	n = 3*len(pts)
+	x, y, z = [None] * n, [None] * n, [None] * n
+	x[0::3] = [sp.x for sp, _ in pts]
+	x[1::3] = [ep.x for _, ep in pts]
+	y[0::3] = [sp.y for sp, _ in pts]
+	y[1::3] = [ep.y for _, ep in pts]
+	z[0::3] = [sp.z for sp, _ in pts]
+	z[1::3] = [ep.z for _, ep in pts]
 	return dict(x=x, y=y, z=z, **kwargs)
 
 
@@ -1,7 +1,6 @@
 from collections import defaultdict
 from typing import Collection
 from itertools import groupby
-from fastcore.basics import first
 from Geometry3D import Vector
 from rich.pretty import pretty_repr
 
@@ -110,7 +109,7 @@ class Printer:
 		#If there's only one segment in avoid, and the anchor point is either on it
 		# or within `avoid_by` of it, move the thread to be perpindicular to it.
 		if len(avoid) == 1:
-			seg = first(avoid)
+			seg = next(iter(avoid))
 			if (anchor in seg or
 					too_close(anchor, seg.start_point, avoid_by) or
 					too_close(anchor, seg.end_point,   avoid_by)):
@@ -191,8 +190,8 @@ class Printer:
 
 		#We only have 1 segment to avoid but can't avoid it. Let's pretend we did
 		# and see what happens.
-		if len(avoid) == 1 and len(vis_segs) == 1 and first(vis_segs) == first(avoid):
-			rprint(f"Can't avoid only segment {first(avoid)}, giving up on trying")
+		if len(avoid) == 1 and len(vis_segs) == 1 and next(iter(vis_segs)) == next(iter(avoid)):
+			rprint(f"Can't avoid only segment {next(iter(avoid))}, giving up on trying")
 			return set()
 
 		#Get all of the visibility points with N intersections, where N is the